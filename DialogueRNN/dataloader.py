@@ -27,7 +27,7 @@ class IEMOCAPDataset(Dataset):
         # print(seq_len)
 
         if self.is_Sn:
-            Sn = get_sn(3, seq_len, self.missing_rate)
+            Sn = get_sn(3, seq_len, self.missing_rate, 'cpu')
 
         # print(Sn)
         # print(torch.tensor(self.videoText[vid], dtype=torch.float32).shape)
@@ -62,11 +62,9 @@ class MatchingAttention(nn.Module):
         elif self.att_type == 'general2':
             M_ = M.permute(1, 2, 0)  # batch, mem_dim, seqlen
             x_ = self.transform(x).unsqueeze(1)  # batch, 1, mem_dim
-            alpha_ = F.softmax((torch.bmm(x_, M_)) * mask.unsqueeze(1), dim=2)  # batch, 1, seqlen
-            alpha_masked = alpha_ * mask.unsqueeze(1)  # batch, 1, seqlen
-            alpha_sum = torch.sum(alpha_masked, dim=2, keepdim=True)  # batch, 1, 1
-            alpha = alpha_masked / alpha_sum  # batch, 1, 1 ; normalized
-            # import ipdb;ipdb.set_trace()
+            bool_mask = mask.bool().unsqueeze(1)  # batch, 1, seqlen
+            scores = torch.bmm(x_, M_).masked_fill(~bool_mask, float('-inf'))  # batch, 1, seqlen
+            alpha = F.softmax(scores, dim=2)  # batch, 1, seqlen ; normalized over unmasked
         else:
             M_ = M.transpose(0, 1)  # batch, seqlen, mem_dim
             x_ = x.unsqueeze(1).expand(-1, M.size()[0], -1)  # batch, seqlen, cand_dim
@@ -34,6 +34,9 @@ parser.add_argument('--dim-y', type=int, default=128, help='Dimension state of c
 parser.add_argument('--dim-a', type=int, default=128, help='Dimension state of attention state.')
 parser.add_argument('--context-attention', default='general', help='Global state attention type.')
 parser.add_argument('--party-attention', default='general', help='Party state attention type')
+parser.add_argument('--bf16', action='store_true', default=False,
+                    help='bf16 autocast for the emotion model, used on Ampere or newer GPUs only.')
+parser.add_argument('--num-workers', type=int, default=4, help='Number of data loader workers for the emotion model.')
 
 parser.add_argument('--lr-e', type=list, default=[1e-4, 1e-5], help='learning rate, [lr, L2 regularization]')
 parser.add_argument('--model-type', type=str, default="base", help='Model used to classify emotion.')
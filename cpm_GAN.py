@@ -202,8 +202,8 @@ class CPMNet_Works_GAN(nn.Module):  # Main parts of the test code
         g, d = dict(), dict()
         g_optim, d_optim = [], []
         for v in range(self.view_num):
-            g[str(v)] = nn.DataParallel(CpmGenerator(self.layer_size[v], self.lsd_dim))
-            d[str(v)] = nn.DataParallel(CpmDiscriminator(self.layer_size[v]))
+            g[str(v)] = nn.DataParallel(CpmGenerator(self.layer_size[v], self.lsd_dim).cuda())
+            d[str(v)] = nn.DataParallel(CpmDiscriminator(self.layer_size[v]).cuda())
             g_optim.append(torch.optim.Adam([{"params": g[str(v)].parameters()}], self.lr[0], betas=(0.5, 0.999)))
             d_optim.append(torch.optim.Adam([{"params": d[str(v)].parameters()}], self.lr[0], betas=(0.5, 0.999)))
         h_optim = torch.optim.Adam([self.h_train], self.lr[0], betas=(0.5, 0.999))
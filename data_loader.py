@@ -86,7 +86,7 @@ class EmoryNlpDataset(Dataset):
             r3 = torch.tensor(self.roberta3[vid], dtype=torch.float32)
             r4 = torch.tensor(self.roberta4[vid], dtype=torch.float32)
         else:
-            sn = self.Sn[index].cpu()
+            sn = self.Sn[index]
             r1 = torch.tensor(self.roberta1[vid], dtype=torch.float32) * sn[:, 0].unsqueeze(dim=1)
             r2 = torch.tensor(self.roberta2[vid], dtype=torch.float32) * sn[:, 1].unsqueeze(dim=1)
             r3 = torch.tensor(self.roberta3[vid], dtype=torch.float32) * sn[:, 2].unsqueeze(dim=1)
@@ -115,6 +115,8 @@ class EmoryNlpDataset(Dataset):
         for i in self.lens:
             accum_item = accum_item + [accum_item[-1] + i]
 
+        # kept on host, __getitem__ runs in DataLoader worker processes
+        Sn = Sn.cpu()
         self.Sn = [Sn[accum_item[x]: accum_item[x + 1], :] for x in range(len(accum_item) - 1)]
 
     def set_h(self, H):
@@ -159,7 +161,7 @@ class MELDDataset(Dataset):
             text = torch.tensor(self.videoText[vid], dtype=torch.float32)
             video = torch.tensor(self.videoAudio[vid], dtype=torch.float32)
         else:
-            sn = self.Sn[index].cpu()
+            sn = self.Sn[index]
             text = torch.tensor(self.videoText[vid], dtype=torch.float32) * sn[:, 0].unsqueeze(dim=1)
             video = torch.tensor(self.videoAudio[vid], dtype=torch.float32) * sn[:, 1].unsqueeze(dim=1)
         x = torch.cat((text, video, self.h[vid]), dim=1)
@@ -186,6 +188,8 @@ class MELDDataset(Dataset):
         for i in self.lens:
             accum_item = accum_item + [accum_item[-1] + i]
 
+        # kept on host, __getitem__ runs in DataLoader worker processes
+        Sn = Sn.cpu()
         self.Sn = [Sn[accum_item[x]: accum_item[x + 1], :] for x in range(len(accum_item) - 1)]
 
     def set_h(self, H):
@@ -241,7 +245,7 @@ class IEMOCAPDataset(Dataset):
             visual = torch.tensor(self.videoVisual[vid], dtype=torch.float32)
             video = torch.tensor(self.videoAudio[vid], dtype=torch.float32)
         else:
-            sn = self.Sn[index].cpu()
+            sn = self.Sn[index]
             text = torch.tensor(self.videoText[vid], dtype=torch.float32) * sn[:, 0].unsqueeze(dim=1)
             visual = torch.tensor(self.videoVisual[vid], dtype=torch.float32) * sn[:, 1].unsqueeze(dim=1)
             video = torch.tensor(self.videoAudio[vid], dtype=torch.float32) * sn[:, 2].unsqueeze(dim=1)
@@ -270,6 +274,8 @@ class IEMOCAPDataset(Dataset):
         for i in self.lens:
             accum_item = accum_item + [accum_item[-1] + i]
 
+        # kept on host, __getitem__ runs in DataLoader worker processes
+        Sn = Sn.cpu()
         self.Sn = [Sn[accum_item[x]: accum_item[x + 1], :] for x in range(len(accum_item) - 1)]
 
     def set_h(self, H):
@@ -15,7 +15,8 @@ class Dialogue_Works(nn.Module):
                  dropout_rec,
                  dropout,
                  lr,
-                 loss_weights=None):
+                 loss_weights=None,
+                 bf16=False):
         """
         :param model: model type of emotional state
         :param D_h: dimension of input
@@ -29,6 +30,7 @@ class Dialogue_Works(nn.Module):
         :param dropout:
         :param lr: learning rate
         :param loss_weights: class balanced weights
+        :param bf16: bf16 autocast for the emotion model on Ampere+ GPUs
         """
         super(Dialogue_Works, self).__init__()
         self.model = model
@@ -41,6 +43,7 @@ class Dialogue_Works(nn.Module):
         self.lr = lr
         self.party_attention = party_attention
         self.party = party
+        self.bf16 = bf16
 
         self.net, self.loss_function, self.optimizer = self.build_model()
 
@@ -61,7 +64,7 @@ class Dialogue_Works(nn.Module):
                 if train:
                     self.optimizer.zero_grad()
 
-                x, q_mask, u_mask, label = [d.cuda() for d in data[:-1]]
+                x, q_mask, u_mask, label = [d.cuda(non_blocking=True) for d in data[:-1]]
                 vid = data[-1]
                 log_prob, c = self.net(x, q_mask, u_mask)  # seq_len, batch, n_classes
 
@@ -106,7 +109,8 @@ class Dialogue_Works(nn.Module):
                         context_attention=self.context_attention,
                         party_attention=self.party_attention,
                         dropout_rec=self.dropout_rec,
-                        dropout=self.dropout).cuda()
+                        dropout=self.dropout,
+                        bf16=self.bf16).cuda()
 
         loss_function = None
         if self.loss_weights is not None:
@@ -1,8 +1,11 @@
+import math
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch.nn import init
-from torch.nn.utils.rnn import pad_sequence
+
+_HAS_SDPA = hasattr(F, 'scaled_dot_product_attention')
 
 
 def init_parameters(net):
@@ -52,48 +55,89 @@ class MatchingAttention(nn.Module):
     def forward(self, M, x, mask=None):
         """
         M -> (seq_len, batch, mem_dim), g_hist..., key and value
-        x -> (batch, cand_dim), U..., query
+        x -> (batch, cand_dim) or (tgt_len, batch, cand_dim), U..., query
         mask -> (batch, seq_len)
+        alpha is None for (tgt_len, batch, cand_dim) queries when the fused sdpa kernel is used
         """
-        if type(mask) == type(None):
-            mask = torch.ones(M.size(1), M.size(0)).type(M.type())
+        if mask is None and self.att_type == 'general2':
+            mask = M.new_ones(M.size(1), M.size(0))  # only general2 reads the mask
+
+        if x.dim() == 3 and _HAS_SDPA and self.att_type in ('dot', 'general', 'general2'):
+            return self._sdpa_forward(M, x, mask), None
 
         if self.att_type == 'dot':
             # vector = cand_dim = mem_dim
             M_ = M.permute(1, 2, 0)  # batch, vector, seqlen
-            x_ = x.unsqueeze(1)  # batch, 1, vector
-            alpha = F.softmax(torch.bmm(x_, M_), dim=2)  # batch, 1, seqlen
+            x_ = _as_queries(x)  # batch, tgt_len, vector
+            alpha = F.softmax(torch.bmm(x_, M_), dim=2)  # batch, tgt_len, seqlen
         elif self.att_type == 'general':
             M_ = M.permute(1, 2, 0)  # batch, mem_dim, seqlen
-            x_ = self.transform(x).unsqueeze(1)  # batch, 1, mem_dim
-            alpha = F.softmax(torch.bmm(x_, M_), dim=2)  # batch, 1, seqlen
+            x_ = _as_queries(self.transform(x))  # batch, tgt_len, mem_dim
+            alpha = F.softmax(torch.bmm(x_, M_), dim=2)  # batch, tgt_len, seqlen
         elif self.att_type == 'general2':
-            print(M.shape)
             M_ = M.permute(1, 2, 0)  # batch, mem_dim, seqlen
-            x_ = self.transform(x).unsqueeze(1)  # batch, 1, mem_dim
-            alpha_ = F.softmax((torch.bmm(x_, M_)) * mask.unsqueeze(1), dim=2)  # batch, 1, seqlen
-            alpha_masked = alpha_ * mask.unsqueeze(1)  # batch, 1, seqlen
-            alpha_sum = torch.sum(alpha_masked, dim=2, keepdim=True)  # batch, 1, 1
-            alpha = alpha_masked / alpha_sum  # batch, 1, 1 ; normalized
-            # import ipdb;ipdb.set_trace()
+            x_ = _as_queries(self.transform(x))  # batch, tgt_len, mem_dim
+            bool_mask = mask.bool().unsqueeze(1)  # batch, 1, seqlen
+            scores = torch.bmm(x_, M_).masked_fill(~bool_mask, float('-inf'))  # batch, tgt_len, seqlen
+            alpha = F.softmax(scores, dim=2)  # batch, tgt_len, seqlen ; normalized over unmasked
         else:
+            assert x.dim() == 2
             M_ = M.transpose(0, 1)  # batch, seqlen, mem_dim
             x_ = x.unsqueeze(1).expand(-1, M.size()[0], -1)  # batch, seqlen, cand_dim
             M_x_ = torch.cat([M_, x_], 2)  # batch, seqlen, mem_dim+cand_dim
             mx_a = F.tanh(self.transform(M_x_))  # batch, seqlen, alpha_dim
             alpha = F.softmax(self.vector_prod(mx_a), 1).transpose(1, 2)  # batch, 1, seqlen
 
-        attn_pool = torch.bmm(alpha, M.transpose(0, 1))[:, 0, :]  # batch, mem_dim
+        attn_pool = torch.bmm(alpha, M.transpose(0, 1))  # batch, tgt_len, mem_dim
+        if x.dim() == 2:
+            attn_pool = attn_pool[:, 0, :]  # batch, mem_dim
+        else:
+            attn_pool = attn_pool.transpose(0, 1)  # tgt_len, batch, mem_dim
 
         return attn_pool, alpha
 
+    def _sdpa_forward(self, M, x, mask):
+        """
+        M -> (seq_len, batch, mem_dim)
+        x -> (tgt_len, batch, cand_dim)
+        mask -> (batch, seq_len), only applied by general2 as in forward
+        return -> (tgt_len, batch, mem_dim), attention weights are never materialized
+        """
+        q = x if self.att_type == 'dot' else self.transform(x)
+        # sdpa divides the scores by sqrt(mem_dim), cancel it to keep the unscaled scores of forward;
+        # done on q rather than via scale=, which torch 2.0 does not accept
+        q = q.transpose(0, 1).unsqueeze(1) * math.sqrt(self.mem_dim)  # batch, 1, tgt_len, mem_dim
+        kv = M.transpose(0, 1).unsqueeze(1)  # batch, 1, seqlen, mem_dim
+        attn_mask = mask.bool()[:, None, None, :] if self.att_type == 'general2' else None  # batch, 1, 1, seqlen
+        attn_pool = F.scaled_dot_product_attention(q, kv, kv, attn_mask=attn_mask)
+        return attn_pool.squeeze(1).transpose(0, 1)
+
+
+def _as_queries(x):
+    """
+    x -> (batch, dim) or (tgt_len, batch, dim)
+    return -> (batch, tgt_len, dim), tgt_len is 1 for a single query
+    """
+    return x.unsqueeze(1) if x.dim() == 2 else x.transpose(0, 1)
+
 
+def _fused_gru(cell, x, h):
+    """
+    GRUCell update without going through nn.GRUCell.forward, cell only holds the parameters
+    x -> (rows, input_size), h -> (rows, hidden_size)
+    """
+    # ATen gru_cell, on CUDA the gate pointwise ops of both gemms run in one fused kernel
+    return torch.gru_cell(x, h, cell.weight_ih, cell.weight_hh, cell.bias_ih, cell.bias_hh)
+
+
+@torch.jit.script
 def _select_parties(X, indices):
-    q0_sel = []
-    for idx, j in zip(indices, X):
-        q0_sel.append(j[idx].unsqueeze(0))
-    q0_sel = torch.cat(q0_sel, 0)
-    return q0_sel
+    """
+    X -> batch, party, dim
+    indices -> batch
+    """
+    idx = indices.view(-1, 1, 1).expand(-1, 1, X.size(-1))  # batch, 1, dim
+    return X.gather(1, idx).squeeze(1)  # batch, dim
 
 
 class DialogueRNNCell(nn.Module):
@@ -123,11 +167,14 @@ class DialogueRNNCell(nn.Module):
         if party_attention is not None:
             self.attention_p1 = MatchingAttention(D_p, D_m, D_a, party_attention)
             self.attention_p2 = MatchingAttention(D_p, D_m, D_a, party_attention)
+            self.register_buffer('other_party', torch.tensor([(1 - p) % party for p in range(party)]),
+                                 persistent=False)
 
-    def forward(self, U, qmask, g_hist, q0, q_hist, e0):
+    def forward(self, U, qmask, g_hist, q0, q_hist, e0, qm_idx=None):
         """
         U -> batch, D_m
         qmask -> batch, party
+        qm_idx -> batch, argmax of qmask when already known
         g_hist -> t-1, batch, D_g
         q_hist -> t-1, batch, party, D_p
         Q -> batch, party, D_p
@@ -135,78 +182,78 @@ class DialogueRNNCell(nn.Module):
         e0 -> batch, party, D_e
         q0_sel -> batch, D_p
         U_c_ -> batch, party, D_m + D_g
+        e_out -> batch, D_e, speaker's emotion state, still attached to the graph; detach it for a context
         """
         if self.party_attention:
-            e0 = torch.zeros(qmask.shape[0], self.party, self.D_e).type(U.type()) if e0.size()[0] == 0 else e0
+            e0 = U.new_zeros(qmask.shape[0], self.party, self.D_e) if e0.size()[0] == 0 else e0
         else:
-            e0 = torch.zeros(qmask.shape[0], self.D_e).type(U.type()) if e0.size()[0] == 0 else e0
+            e0 = U.new_zeros(qmask.shape[0], self.D_e) if e0.size()[0] == 0 else e0
 
-        q0 = torch.zeros(qmask.shape[0], self.party, self.D_p).type(U.type()) if q0.size()[0] == 0 else q0
+        q0 = U.new_zeros(qmask.shape[0], self.party, self.D_p) if q0.size()[0] == 0 else q0
 
-        qm_idx = torch.argmax(qmask, 1)  # indicate which person
+        if qm_idx is None:
+            qm_idx = torch.argmax(qmask, 1)  # indicate which person
         q0_sel = _select_parties(q0, qm_idx)
         e0_sel = _select_parties(e0, qm_idx) if self.party_attention else e0
 
         if g_hist.size()[0] == 0:
-            g_ = self.g_cell(torch.cat([U, q0_sel, e0_sel], dim=1),
-                             torch.zeros((U.shape[0], self.D_g), dtype=torch.float32).type(U.type()))
+            g_ = _fused_gru(self.g_cell, torch.cat([U, q0_sel, e0_sel], dim=1),
+                            U.new_zeros(U.shape[0], self.D_g))
         else:
-            g_ = self.g_cell(torch.cat([U, q0_sel, e0_sel], dim=1), g_hist[-1])
+            g_ = _fused_gru(self.g_cell, torch.cat([U, q0_sel, e0_sel], dim=1), g_hist[-1])
 
         g_ = self.dropout(g_)
-        g_hist = torch.cat([g_hist, g_.unsqueeze(0)], 0)
+        g_hist = g_.unsqueeze(0) if g_hist.size()[0] == 0 else torch.cat([g_hist, g_.unsqueeze(0)], 0)
 
         if g_hist.shape[0] == 0:
-            gc_ = torch.zeros((U.shape[0], self.D_g), dtype=torch.float32).type(U.type())
+            gc_ = U.new_zeros(U.shape[0], self.D_g)
             alpha = None
         else:
             gc_, alpha = self.attention(g_hist, U)  # batch_size, D_g
         # c_ = torch.zeros(U.size()[0],self.D_g).type(U.type()) if g_hist.size()[0]==0\
         #         else self.attention(g_hist,U)[0] # batch, D_g
-        U_gc_ = torch.cat((U, gc_, e0_sel), dim=1).unsqueeze(1).expand(-1, qmask.size()[1], -1)
+        # concatenated straight into the per-party layout, a single copy instead of cat then contiguous
+        U_gc_ = torch.cat([x.unsqueeze(1).expand(-1, qmask.size()[1], -1) for x in (U, gc_, e0_sel)],
+                          dim=2)  # batch, party, D_m + D_g + D_e
 
-        qs_ = self.p_cell(U_gc_.contiguous().view(-1, self.D_m + self.D_g + self.D_e),
-                          q0.view(-1, self.D_p)).view(U.shape[0], -1, self.D_p)
+        qs_ = _fused_gru(self.p_cell, U_gc_.view(-1, self.D_m + self.D_g + self.D_e),
+                         q0.view(-1, self.D_p)).view(U.shape[0], -1, self.D_p)
         qs_ = self.dropout(qs_)
 
         ql_ = q0
         qmask_ = qmask.unsqueeze(2)
         q_ = ql_ * (1 - qmask_) + qs_ * qmask_
         # q_ = qs_
-        q_hist = torch.cat([q_hist, q_.unsqueeze(0)], 0)
+        q_hist = q_.unsqueeze(0) if q_hist.size()[0] == 0 else torch.cat([q_hist, q_.unsqueeze(0)], 0)
 
         if self.party_attention is not None:
             # party emotion section
             # personal attention for emotion context
-            Q = torch.zeros((U.shape[0], self.party, self.D_p), dtype=torch.float32).type(U.type())
-            Qp = torch.zeros((U.shape[0], self.party, self.D_p), dtype=torch.float32).type(U.type())
-            if q_hist.size()[0] == 0:
-                # batch, party, D_p
-                alpha_p = None
-            else:
-                for p in range(self.party):
-                    Q_, _ = self.attention_p1(q_hist[:, :, 1 - p, :], U)  # batch_size, D_p
-                    Q[:, p, :] = Q_
-
-                    Q_, _ = self.attention_p2(q_hist[:, :, p, :], U)  # batch_size, D_p
-                    Qp[:, p, :] = Q_
-                # Q = self.sa(q_, q_, q_)
+            # every party attends with the same U, so parties are folded into the batch axis;
+            # the folded history is a plain view, each party's slice stays contiguous
+            U_rep = U.unsqueeze(1).expand(-1, self.party, -1).reshape(-1, self.D_m)  # batch*party, D_m
+            q_hist_ = q_hist.reshape(q_hist.size()[0], -1, self.D_p)  # t, batch*party, D_p
+
+            Q, _ = self.attention_p1(q_hist_, U_rep)
+            # party p reads the pooled history of party 1-p, swap on the pooled result instead of the history
+            Q = Q.view(U.shape[0], self.party, self.D_p).index_select(1, self.other_party)  # batch, party, D_p
+
+            Qp, _ = self.attention_p2(q_hist_, U_rep)
+            Qp = Qp.view(U.shape[0], self.party, self.D_p)  # batch, party, D_p
+            # Q = self.sa(q_, q_, q_)
             U_Q = torch.cat([Q, Qp, g_.unsqueeze(1).expand(-1, qmask.size()[1], -1)], dim=2)
-            es_ = self.e_cell(U_Q.contiguous().view(-1, self.D_p + self.D_p + self.D_g),
-                              e0.view(-1, self.D_e)).view(U.size()[0], -1, self.D_e)
+            es_ = _fused_gru(self.e_cell, U_Q.view(-1, self.D_p + self.D_p + self.D_g),
+                             e0.view(-1, self.D_e)).view(U.size()[0], -1, self.D_e)
             es_ = self.dropout(es_)
 
             el_ = e0
             e_ = el_ * (1 - qmask_) + es_ * qmask_
 
         else:
-            e_ = self.e_cell(_select_parties(q_, qm_idx), e0_sel)
+            e_ = _fused_gru(self.e_cell, _select_parties(q_, qm_idx), e0_sel)
             e_ = self.dropout(e_)
 
-        if self.party_attention:
-            e_out = _select_parties(e_, qm_idx).detach()
-        else:
-            e_out = e_.detach()
+        e_out = _select_parties(e_, qm_idx) if self.party_attention else e_
         return g_, q_, e_, e_out, alpha
 
 
@@ -235,52 +282,60 @@ class DialogueRNN(nn.Module):
         c -> # seq_len, batch, D_e
         e_ -> # batch, party, D_e
         """
+        return self._collect(list(self._steps(U, qmask)))
 
-        g_hist = torch.zeros(0).type(U.type())  # 0-dimensional tensor
-        q_hist = torch.zeros(0).type(U.type())  # 0-dimensional tensor
-
-        q_ = torch.zeros(0).type(U.type())  # batch, party, D_p
-        e_ = torch.zeros(0).type(U.type())
-        c_ = torch.zeros(0).type(U.type())
-
-        e, alpha, c = [], [], []
-        for u_, qmask_ in zip(U, qmask):
-            g_, q_, e_, c_, alpha_ = self.dialogue_cell(u_, qmask_, g_hist, q_, q_hist, e_)
+    def _steps(self, U, qmask):
+        """
+        Runs the recurrence one step per next(), yielding (e_out, alpha_) of every step,
+        so the caller can interleave it with another recurrence
+        """
+        g_hist = U.new_zeros(0)  # 0-dimensional tensor
+        q_hist = U.new_zeros(0)  # 0-dimensional tensor
 
-            if self.party_attention is not None:
-                qm_idx = torch.argmax(qmask_, dim=1)
-                e_party = _select_parties(e_, qm_idx)
-                e.append(e_party)
-            else:
-                e.append(e_)
-            c.append(c_)
+        # initial states with their full shapes, so the first step matches the shapes of all later ones
+        q_ = U.new_zeros(U.size()[1], qmask.size()[2], self.D_p)  # batch, party, D_p
+        if self.party_attention is not None:
+            e_ = U.new_zeros(U.size()[1], qmask.size()[2], self.D_e)  # batch, party, D_e
+        else:
+            e_ = U.new_zeros(U.size()[1], self.D_e)  # batch, D_e
 
-            if type(alpha_) != type(None):
-                alpha.append(alpha_[:, 0, :])
+        qm_idx_all = torch.argmax(qmask, dim=2)  # seq_len, batch ; speaker of every step in one reduction
+        for u_, qmask_, qm_idx in zip(U, qmask, qm_idx_all):
+            g_, q_, e_, e_out, alpha_ = self.dialogue_cell(u_, qmask_, g_hist, q_, q_hist, e_, qm_idx)
+            yield e_out, alpha_
 
-        return torch.stack(e).type(U.type()), torch.stack(c).type(U.type()), alpha
+    @staticmethod
+    def _collect(steps):
+        """
+        steps -> [(e_out, alpha_)] of every step, as yielded by _steps
+        """
+        # per-step outputs are stacked once at the end, in-place writes into a preallocated output
+        # would add one CopySlices node per step whose backward copies the whole output gradient
+        e = torch.stack([e_out for e_out, _ in steps])  # seq_len, batch, D_e
+        alpha = [alpha_[:, 0, :] for _, alpha_ in steps if alpha_ is not None]
+        # the context is the same emotion state cut from the graph
+        return e, e.detach(), alpha
 
 
+@torch.jit.script
 def _reverse_seq(X, mask):
     """
     X -> seq_len, batch, dim
     mask -> batch, seq_len
     """
-    X_ = X.transpose(0, 1)
-    mask_sum = torch.sum(mask, 1).int()
-
-    xfs = []
-    for x, c in zip(X_, mask_sum):
-        xf = torch.flip(x[:c], [0])
-        xfs.append(xf)
-
-    return pad_sequence(xfs)
+    T, B = X.size()[0], X.size()[1]
+    lens = torch.sum(mask, 1).long()  # batch
+    row = torch.arange(T, device=X.device).view(T, 1)  # seq_len, 1
+    # step t of sample b reads step t + (T - len_b) of the fully flipped sequence
+    idx = (row + (T - lens).view(1, B)) % T  # seq_len, batch
+    X_ = torch.flip(X, [0]).gather(0, idx.unsqueeze(2).expand(-1, -1, X.size()[2]))
+    return X_.masked_fill((row >= lens.view(1, B)).unsqueeze(2), 0)  # zero padding as pad_sequence did
 
 
 class Model(nn.Module):
     def __init__(self, D_h, D_g, D_p, D_e, D_y, party,
                  n_classes, context_attention='simple', party_attention='simple',
-                 D_a=100, dropout_rec=0.5, dropout=0.5):
+                 D_a=100, dropout_rec=0.5, dropout=0.5, bf16=False):
         super(Model, self).__init__()
 
         self.D_h = D_h
@@ -304,6 +359,57 @@ class Model(nn.Module):
         self.smax_fc = nn.Linear(D_y // 2, n_classes)
 
         self.matchatt = MatchingAttention(D_e, D_e, att_type='general2')
+        self._streams = None  # cuda streams of the forward and backward dialogue rnn
+        self.bf16 = bf16
+        self._bf16_devices = {}  # device -> whether bf16 autocast is used there
+
+    def _use_bf16(self, device):
+        """
+        bf16 autocast only when requested and only on GPUs with native bf16 (Ampere+),
+        pre-Ampere cards would run emulated bf16 gemms; worked out once per device
+        """
+        if device not in self._bf16_devices:
+            self._bf16_devices[device] = self.bf16 and device.type == 'cuda' and \
+                                         torch.cuda.get_device_capability(device)[0] >= 8
+        return self._bf16_devices[device]
+
+    def _dialog_rnns(self, U, qmask, rev_U, rev_qmask):
+        """
+        Both directions share no state, on GPU they are issued on their own streams and
+        interleaved step by step, so both queues hold work while the host is still launching
+        the many small per-step kernels and one recurrence can overlap with the other.
+        """
+        if not U.is_cuda:
+            return self.dialog_rnn_f(U, qmask), self.dialog_rnn_b(rev_U, rev_qmask)
+
+        if self._streams is None or self._streams[0].device != U.device:
+            self._streams = (torch.cuda.Stream(U.device), torch.cuda.Stream(U.device))
+        stream_f, stream_b = self._streams
+        current = torch.cuda.current_stream(U.device)
+
+        # inputs were produced on the current stream
+        stream_f.wait_stream(current)
+        stream_b.wait_stream(current)
+        steps_f = self.dialog_rnn_f._steps(U, qmask)
+        steps_b = self.dialog_rnn_b._steps(rev_U, rev_qmask)
+        outs_f, outs_b = [], []
+        for _ in range(U.size(0)):
+            with torch.cuda.stream(stream_f):
+                outs_f.append(next(steps_f))
+            with torch.cuda.stream(stream_b):
+                outs_b.append(next(steps_b))
+        with torch.cuda.stream(stream_f):
+            out_f = DialogueRNN._collect(outs_f)
+        with torch.cuda.stream(stream_b):
+            out_b = DialogueRNN._collect(outs_b)
+        current.wait_stream(stream_f)
+        current.wait_stream(stream_b)
+
+        # outputs are consumed on the current stream, keep the allocator from recycling them early;
+        # c is e detached and shares its storage
+        for e, _, _ in (out_f, out_b):
+            e.record_stream(current)
+        return out_f, out_b
 
     def forward(self, U, qmask, umask=None, att2=False):
         """
@@ -311,31 +417,29 @@ class Model(nn.Module):
         qmask -> seq_len, batch, party
         """
 
-        emotions_f, c_f, _ = self.dialog_rnn_f(U, qmask)  # seq_len, batch, D_e
-        emotions_f = self.dropout_rec(emotions_f)
-
-        rev_U = _reverse_seq(U, umask)
-        rev_qmask = _reverse_seq(qmask, umask)
-
-        emotions_b, c_b, _ = self.dialog_rnn_b(rev_U, rev_qmask)
-        emotions_b = _reverse_seq(emotions_b, umask)
-        emotions_b = self.dropout_rec(emotions_b)
-        emotions = torch.cat([emotions_f, emotions_b], dim=-1)
-
-        c = torch.cat((c_f, c_b), dim=-1)
-        # emotions = emotions.unsqueeze(1)
-        if att2 and self.party_attention == "simple":
-            att_emotions = []
-            for t in emotions:
-                att_emotions.append(self.matchatt(emotions, t, mask=umask)[0].unsqueeze(0))
-            att_emotions = torch.cat(att_emotions, dim=0)
-            hidden = F.relu(self.linear1(att_emotions))
-        else:
-            hidden = F.relu(self.linear1(emotions))
-        hidden = F.relu(self.linear2(hidden))
-        # hidden = F.relu(self.linear3(hidden))
-        hidden = self.dropout(hidden)
-        log_prob = F.log_softmax(self.smax_fc(hidden), 2)  # seq_len, batch, n_classes
+        # bf16 for the recurrences, attention and hidden layers; the classifier and softmax stay in fp32
+        with torch.autocast('cuda', dtype=torch.bfloat16, enabled=self._use_bf16(U.device)):
+            rev_U = _reverse_seq(U, umask)
+            rev_qmask = _reverse_seq(qmask, umask)
+
+            (emotions_f, c_f, _), (emotions_b, c_b, _) = self._dialog_rnns(U, qmask, rev_U, rev_qmask)
+            emotions_f = self.dropout_rec(emotions_f)  # seq_len, batch, D_e
+
+            emotions_b = _reverse_seq(emotions_b, umask)
+            emotions_b = self.dropout_rec(emotions_b)
+            emotions = torch.cat([emotions_f, emotions_b], dim=-1)
+
+            c = torch.cat((c_f, c_b), dim=-1)
+            # emotions = emotions.unsqueeze(1)
+            if att2 and self.party_attention == "simple":
+                att_emotions, _ = self.matchatt(emotions, emotions, mask=umask)  # seq_len, batch, 2 * D_e
+                hidden = F.relu(self.linear1(att_emotions))
+            else:
+                hidden = F.relu(self.linear1(emotions))
+            hidden = F.relu(self.linear2(hidden))
+            # hidden = F.relu(self.linear3(hidden))
+            hidden = self.dropout(hidden)
+        log_prob = F.log_softmax(self.smax_fc(hidden.float()), 2)  # seq_len, batch, n_classes
         return log_prob, c
 
 
@@ -345,7 +449,8 @@ class MaskedNLLLoss(nn.Module):
         super(MaskedNLLLoss, self).__init__()
         self.weight = weight
         self.loss = nn.NLLLoss(weight=weight,
-                               reduction='sum')
+                               reduction='sum',
+                               ignore_index=-100)
 
     def forward(self, pred, target, mask):
         """
@@ -353,12 +458,13 @@ class MaskedNLLLoss(nn.Module):
         target -> batch*seq_len
         mask -> batch, seq_len
         """
-        mask_ = mask.view(-1, 1)  # batch*seq_len, 1
-        if type(self.weight) == type(None):
-            loss = self.loss(pred * mask_, target) / torch.sum(mask)
+        mask_ = mask.view(-1)  # batch*seq_len
+        target_ = target.masked_fill(mask_ == 0, -100)  # padded steps are skipped through ignore_index
+        if self.weight is None:
+            loss = self.loss(pred, target_) / torch.sum(mask)
         else:
-            loss = self.loss(pred * mask_, target) \
-                   / torch.sum(self.weight[target] * mask_.squeeze())
+            loss = self.loss(pred, target_) \
+                   / torch.sum(self.weight[target] * mask_)
         return loss
 
 
@@ -385,10 +491,12 @@ class CPMNets(nn.Module):  # The architecture of the CPM
         self.testLen = testLen
         self.lamb = lamb
         # initialize forward methods
-        self.net = self._make_view(v).cuda()
+        self.net = self._make_view(v)
 
     def forward(self, h):
-        h_views = self.net(h.cuda())
+        # callers move the module once and pass h on the same device, no copy per call
+        assert h.device == next(self.parameters()).device
+        h_views = self.net(h)
         return h_views
 
     def _make_view(self, v):
@@ -421,7 +529,6 @@ class CpmGenerator(nn.Module):
             nn.Linear(layer_size[0], layer_size[1]),
         )
         # init_parameters(self.model)
-        self.model.cuda()
 
     def forward(self, x):
         return self.model(x)
@@ -436,7 +543,6 @@ class CpmDiscriminator(nn.Module):
             nn.Linear(layer_size[1] // 2, 1),
         )
         # init_parameters(self.model)
-        self.model.cuda()
 
     def forward(self, x):
         return self.model(x)
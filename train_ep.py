@@ -12,7 +12,6 @@ from data_loader import IEMOCAPDataset, IEMOCAPDatasetUtter, get_loaders, HDatas
 from cpm import CPMNet_Works
 from dialogue import Dialogue_Works
 from utils import get_sn, ave
-import numpy as np
 import torch
 from sklearn.metrics import accuracy_score
 
@@ -52,6 +51,8 @@ if __name__ == "__main__":
     loss_weights = args.loss_weights
     model_type = args.model_type
     party_attention = args.party_attention
+    bf16 = args.bf16
+    num_workers = args.num_workers
 
     dim_g = args.dim_g
     dim_p = args.dim_p
@@ -108,14 +109,10 @@ if __name__ == "__main__":
     len_train_utter = len(train_set_utter)
     len_test_utter = len(test_set_utter)
 
-    Sn = get_sn(num_views, len_train_utter + len_test_utter, missing_rate)  # [num_samples, num_views]
+    Sn = get_sn(num_views, len_train_utter + len_test_utter, missing_rate, device)  # [num_samples, num_views]
     # Sn = np.concatenate([np.ones([len_train_utter + len_test_utter, 1]), Sn], axis=1)
-    Sn_train = Sn[np.arange(len_train_utter)]
-    Sn_test = Sn[np.arange(len_test_utter) + len_train_utter]
-
-    Sn = torch.tensor(Sn, dtype=torch.long).cuda()
-    Sn_train = torch.tensor(Sn_train, dtype=torch.long).cuda()
-    Sn_test = torch.tensor(Sn_test, dtype=torch.long).cuda()
+    Sn_train = Sn[:len_train_utter]
+    Sn_test = Sn[len_train_utter:]
 
     # set Sn matrix to data set
     train_set.set_Sn(Sn_train)
@@ -143,7 +140,8 @@ if __name__ == "__main__":
                              dropout_rec=rec_dropout,
                              dropout=dropout,
                              lr=lr_e,
-                             loss_weights=loss_weights).cuda()
+                             loss_weights=loss_weights,
+                             bf16=bf16).cuda()
 
     data_set_e_train = train_set
     data_set_e_test = test_set
@@ -154,12 +152,18 @@ if __name__ == "__main__":
         data_loader_e_train = DataLoader(data_set_e_train,
                                          batch_size=e_batch_size,
                                          collate_fn=data_set_e_train.collate_fn,
-                                         shuffle=False)
+                                         shuffle=False,
+                                         num_workers=num_workers,
+                                         pin_memory=True,
+                                         persistent_workers=num_workers > 0)
 
         data_loader_e_test = DataLoader(data_set_e_test,
                                         batch_size=e_batch_size,
                                         collate_fn=data_set_e_test.collate_fn,
-                                        shuffle=False)
+                                        shuffle=False,
+                                        num_workers=num_workers,
+                                        pin_memory=True,
+                                        persistent_workers=num_workers > 0)
 
         # net parameter init
         model_e.init_model()
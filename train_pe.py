@@ -6,7 +6,6 @@ from data_loader import IEMOCAPDataset, IEMOCAPDatasetUtter, get_loaders, HDatas
 from cpm import CPMNet_Works
 from dialogue import Dialogue_Works
 from utils import get_sn, ave
-import numpy as np
 import torch
 from sklearn.metrics import accuracy_score
 
@@ -68,13 +67,9 @@ if __name__ == "__main__":
     len_train_utter = len(train_set_utter)
     len_test_utter = len(test_set_utter)
 
-    Sn = get_sn(num_views, len_train_utter + len_test_utter, missing_rate)  # [num_samples, num_views]
-    Sn_train = Sn[np.arange(len_train_utter)]
-    Sn_test = Sn[np.arange(len_test_utter) + len_train_utter]
-
-    Sn = torch.tensor(Sn, dtype=torch.long).to(device)
-    Sn_train = torch.tensor(Sn_train, dtype=torch.long).to(device)
-    Sn_test = torch.tensor(Sn_test, dtype=torch.long).to(device)
+    Sn = get_sn(num_views, len_train_utter + len_test_utter, missing_rate, device)  # [num_samples, num_views]
+    Sn_train = Sn[:len_train_utter]
+    Sn_test = Sn[len_train_utter:]
 
     train_set_utter.set_Sn(Sn_train)
     test_set_utter.set_Sn(Sn_test)
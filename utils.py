@@ -1,38 +1,36 @@
 import numpy as np
-from numpy.random import randint
-from sklearn.preprocessing import OneHotEncoder
 import torch
+import torch.nn.functional as F
 
 
-def get_sn(view_num, len_data, missing_rate):
-    """Randomly generate incomplete data information, simulate partial view data with complete view data
+def get_sn(view_num, len_data, missing_rate, device):
+    """Randomly generate incomplete data information, simulate partial view data with complete view data,
+    drawn directly on device
     :param view_num:view number
     :param len_data:number of samples
     :param missing_rate:Defined in section 3.2 of the paper
-    :return:Sn
+    :param device:device of the returned matrix
+    :return:Sn, long tensor [len_data, view_num]
     """
-    matrix = None
     one_rate = 1 - missing_rate
     if one_rate <= (1 / view_num):
-        enc = OneHotEncoder()
-        view_preserve = enc.fit_transform(randint(0, view_num, size=(len_data, 1))).toarray()
-        return view_preserve
-    error = 1
+        return F.one_hot(torch.randint(0, view_num, (len_data,), device=device), view_num)
     if one_rate == 1:
-        matrix = randint(1, 2, size=(len_data, view_num))
-        return matrix
+        return torch.ones((len_data, view_num), dtype=torch.long, device=device)
+    matrix = None
+    error = 1
     while error >= 0.005:
-        enc = OneHotEncoder()
-        view_preserve = enc.fit_transform(randint(0, view_num, size=(len_data, 1))).toarray()
+        # every sample keeps at least one view
+        view_preserve = F.one_hot(torch.randint(0, view_num, (len_data,), device=device), view_num)
         one_num = view_num * len_data * one_rate - len_data
         ratio = one_num / (view_num * len_data)
-        matrix_iter = (randint(0, 100, size=(len_data, view_num)) < int(ratio * 100)).astype(np.int)
-        a = np.sum(((matrix_iter + view_preserve) > 1).astype(np.int))
+        matrix_iter = (torch.randint(0, 100, (len_data, view_num), device=device) < int(ratio * 100)).long()
+        a = ((matrix_iter + view_preserve) > 1).sum().item()
         one_num_iter = one_num / (1 - a / one_num)
         ratio = one_num_iter / (view_num * len_data)
-        matrix_iter = (randint(0, 100, size=(len_data, view_num)) < int(ratio * 100)).astype(np.int)
-        matrix = ((matrix_iter + view_preserve) > 0).astype(np.int)
-        ratio = np.sum(matrix) / (view_num * len_data)
+        matrix_iter = (torch.randint(0, 100, (len_data, view_num), device=device) < int(ratio * 100)).long()
+        matrix = ((matrix_iter + view_preserve) > 0).long()
+        ratio = matrix.sum().item() / (view_num * len_data)
         error = abs(one_rate - ratio)
     return matrix
 